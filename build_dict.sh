@@ -1,9 +1,12 @@
 #!/bin/sh
 
 KANJIDIC=util/kanjidic
+KRADFILE=util/kradfile
 EDICT=util/edict
 ENAMDICT=util/enamdict
 DICT=yomi_base/japanese/dictionary.db
+BLOOM=yomi_base/japanese/dictionary.bloom
 
 [ -f $DICT ] && rm $DICT
-util/compile.py --kanjidic $KANJIDIC --edict $EDICT $DICT --enamdict $ENAMDICT
+[ -f $BLOOM ] && rm $BLOOM
+util/compile.py --kanjidic $KANJIDIC --kradfile $KRADFILE --edict $EDICT $DICT --enamdict $ENAMDICT
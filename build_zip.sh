@@ -3,4 +3,4 @@
 ZIP=yomichan.zip
 
 [ -f $ZIPFILE ] rm $ZIP
-7z a yomichan.zip -xr\!\*.pyc yomichan.py yomi_base
+7z a yomichan.zip -xr\!\*.pyc -xr\!\*.cache yomichan.py yomi_base
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2013  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import imp
+import json
+import os
+import re
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'yomi_base/japanese'))
+
+import deinflect
+
+compiler = imp.load_source('compiler', os.path.join(ROOT, 'util/compile.py'))
+
+
+class TestTagMatcher(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(ROOT, 'yomi_base/japanese/deinflect.json'), 'rb') as fp:
+            self.rules = json.loads(fp.read().decode('utf-8'))
+
+        self.variants = [variant for group in self.rules.values() for variant in group]
+        self.matcher = deinflect.TagMatcher([pattern for variant in self.variants for pattern in variant['tagsOut']])
+
+
+    def match(self, patterns, tags):
+        return any(re.search(pattern, tag) for pattern in patterns for tag in tags)
+
+
+    def check(self, patterns, tags):
+        expected = self.match(patterns, tags)
+        actual = self.matcher.patternMask(patterns) & self.matcher.tagMask(tags) != 0
+        self.assertEqual(expected, actual, '{0} against {1}'.format(patterns, tags))
+
+
+    def testRuleTags(self):
+        for variantOut in self.variants:
+            for variantIn in self.variants:
+                self.check(variantOut['tagsOut'], variantIn['tagsIn'])
+
+
+    def testParsedTags(self):
+        for variant in self.variants:
+            for tag in compiler.PARSED_TAGS:
+                self.check(variant['tagsOut'], [tag])
+
+
+    def testPrefixSemantics(self):
+        self.check(['v5'], ['v5k'])
+        self.check(['vs-'], ['vs-i'])
+        self.check(['vs-'], ['vs'])
+        self.assertTrue(self.match(['v5'], ['v5k']))
+        self.assertTrue(self.match(['vs-'], ['vs-i']))
+        self.assertFalse(self.match(['vs-'], ['vs']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2013  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import imp
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'yomi_base/japanese'))
+
+import dictionary
+
+compiler = imp.load_source('compiler', os.path.join(ROOT, 'util/compile.py'))
+
+
+TERMS = [
+    (u'食べる', u'たべる', u'(v1,vt,P) to eat', u'P v1 vt'),
+    (u'高い', u'たかい', u'(adj-i,P) high', u'P adj-i'),
+    (u'日本', u'にほん', u'(n,P) Japan', u'P n'),
+    (u'日本語', u'にほんご', u'(n,P) Japanese language', u'P n'),
+]
+
+
+class TestTermQueries(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'dictionary.db')
+        with sqlite3.connect(self.filename) as db:
+            compiler.writeEdict(db, TERMS)
+
+        self.dictionary = dictionary.Dictionary(self.filename, index=False)
+
+
+    def tearDown(self):
+        self.dictionary.db.close()
+        shutil.rmtree(self.directory)
+
+
+    def plan(self, query, params):
+        return [row[-1] for row in self.dictionary.db.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()]
+
+
+    def assertIndexed(self, details):
+        for index in ['index_Terms_expression', 'index_Terms_reading']:
+            pattern = r'SEARCH (TABLE )?Terms USING (COVERING )?INDEX {0} '.format(index)
+            self.assertTrue(any(re.match(pattern, detail) for detail in details), '{0} not used in {1}'.format(index, details))
+
+
+    def testTermQuery(self):
+        for glossaries in [True, False]:
+            self.assertIndexed(self.plan(self.dictionary.termQuery(glossaries), [u'日本'] * 2))
+
+
+    def testTermsQuery(self):
+        words = [u'日本', u'たべる', u'高い']
+        for glossaries in [True, False]:
+            self.assertIndexed(self.plan(self.dictionary.termsQuery(glossaries, len(words)), words * 2))
+
+
+    def testFindTerm(self):
+        self.assertEqual([term.expression for term in self.dictionary.findTerm(u'にほん')], [u'日本'])
+        self.assertEqual([term.expression for term in self.dictionary.findTerm(u'日本語')], [u'日本語'])
+
+
+    def testFindPattern(self):
+        self.assertEqual(sorted(term.expression for term in self.dictionary.findPattern(u'日本%')), [u'日本', u'日本語'])
+        self.assertEqual([term.expression for term in self.dictionary.findPattern(u'%語')], [u'日本語'])
+        for pattern in [u'%', u'_', u'%_%']:
+            self.assertEqual(self.dictionary.findPattern(pattern), list())
+
+
+    def testFindPrefixes(self):
+        results = self.dictionary.findPrefixes(u'日本語です')
+        self.assertEqual(sorted(results.keys()), sorted([u'日', u'日本', u'日本語', u'日本語で', u'日本語です']))
+        self.assertEqual([term.expression for term in results[u'日本']], [u'日本'])
+        self.assertEqual([term.expression for term in results[u'日本語']], [u'日本語'])
+        self.assertEqual(results[u'日本語で'], list())
+
+
+class TestFilter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def build(self, name, terms):
+        filename = os.path.join(self.directory, name + '.db')
+        with sqlite3.connect(filename) as db:
+            compiler.writeEdict(db, terms)
+            compiler.writeFilter(filename, db)
+
+        return filename
+
+
+    def testMatchingFilter(self):
+        result = dictionary.Dictionary(self.build('dictionary', TERMS))
+        self.assertIsNotNone(result.filter)
+        self.assertEqual([term.expression for term in result.findTerm(u'たかい')], [u'高い'])
+
+
+    def testStaleFilter(self):
+        filename = self.build('dictionary', TERMS[:2])
+        other = self.build('other', TERMS[2:])
+        shutil.copy(os.path.splitext(other)[0] + '.bloom', os.path.splitext(filename)[0] + '.bloom')
+
+        result = dictionary.Dictionary(filename)
+        self.assertIsNone(result.filter)
+        self.assertEqual([term.expression for term in result.findTerm(u'たべる')], [u'食べる'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2013  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import imp
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'yomi_base/japanese'))
+
+import deinflect
+import dictionary
+import translate
+
+compiler = imp.load_source('compiler', os.path.join(ROOT, 'util/compile.py'))
+
+
+TERMS = [
+    (u'高い', u'たかい', u'(adj-i,P) high', u'P adj-i'),
+    (u'高い', u'たかい', u'(adj-i,P) high', u'P adj-i'),
+    (u'高い', u'たかい', u'(adj-i) expensive', u'adj-i'),
+    (u'高', u'こう', u'(n) height', u'n'),
+]
+
+
+class TestFindTerm(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory, 'dictionary.db')
+        with sqlite3.connect(filename) as db:
+            compiler.writeEdict(db, TERMS)
+            compiler.writeFilter(filename, db)
+
+        self.translator = translate.Translator(
+            deinflect.Deinflector(os.path.join(ROOT, 'yomi_base/japanese/deinflect.json')),
+            dictionary.Dictionary(filename)
+        )
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def glossaries(self, results):
+        return [result.glossary for result in results]
+
+
+    def testLimitAfterDuplicates(self):
+        full, length = self.translator.findTerm(u'高い')
+        self.assertEqual(self.glossaries(full), [u'(adj-i,P) high', u'(adj-i) expensive', u'(n) height'])
+        self.assertEqual(length, 2)
+
+        for limit in xrange(1, 5):
+            results, length = self.translator.findTerm(u'高い', limit=limit)
+            self.assertEqual(self.glossaries(results), self.glossaries(full)[:limit])
+            self.assertEqual(length, 2)
+
+
+INFLECTED_TERMS = [
+    (u'来る', u'くる', u'(vk,vi,P) to come', u'P vi vk'),
+    (u'呉れる', u'くれる', u'(v1,vt,P) to give', u'P v1 vt'),
+    (u'為る', u'する', u'(vs-i,P) to do', u'P vs-i'),
+    (u'させる', None, u'(v1,vt,P) to make (someone) do', u'P v1 vt'),
+    (u'食べる', u'たべる', u'(v1,vt,P) to eat', u'P v1 vt'),
+]
+
+INFLECTED_SAMPLES = [u'くれなかった', u'させられる', u'させられなかった', u'こなかった', u'食べさせられなかった', u'たべました']
+
+
+class TestInflections(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(ROOT, 'yomi_base/japanese/deinflect.json'), 'rb') as fp:
+            self.rules = json.loads(fp.read().decode('utf-8'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def build(self, name, depth=0):
+        filename = os.path.join(self.directory, name + '.db')
+        with sqlite3.connect(filename) as db:
+            compiler.writeEdict(db, INFLECTED_TERMS)
+            if depth > 0:
+                compiler.writeInflections(db, compiler.parseInflections(self.rules, INFLECTED_TERMS, depth))
+                compiler.writeMetadata(db, {'inflectionDepth': depth})
+
+        return filename
+
+
+    def translator(self, filename, maxDepth=10):
+        deinflector = deinflect.Deinflector(os.path.join(ROOT, 'yomi_base/japanese/deinflect.json'), maxDepth=maxDepth)
+        return translate.Translator(deinflector, dictionary.Dictionary(filename))
+
+
+    def results(self, translator, text):
+        return sorted(set((result.expression, result.source, result.rules) for result in translator.findTerm(text)[0]))
+
+
+    def compare(self, expected, actual):
+        for text in INFLECTED_SAMPLES:
+            self.assertEqual(self.results(expected, text), self.results(actual, text), text)
+
+
+    def testPartialTable(self):
+        expected = self.translator(self.build('plain'))
+        for depth in [1, 2]:
+            self.compare(expected, self.translator(self.build('depth{0}'.format(depth), depth)))
+
+
+    def testCompleteTable(self):
+        plain = self.build('plain')
+        for depth in [1, 2]:
+            expected = self.translator(plain, depth)
+            self.compare(expected, self.translator(self.build('depth{0}'.format(depth), depth), depth))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2013  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../yomi_base/japanese'))
+
+import util
+
+
+class TestSanitize(unittest.TestCase):
+    def testJapanese(self):
+        self.assertEqual(util.sanitize(u'abc日本語、です。\n'), u'日本語です')
+        self.assertEqual(util.sanitize(u'日本語です', kana=False), u'日本語')
+
+
+    def testWildcards(self):
+        self.assertEqual(util.sanitize(u'日*本?％＊？_', wildcards=True), u'日%本_%__')
+        self.assertEqual(util.sanitize(u'日*本?', kana=False, wildcards=True), u'日%本_')
+        self.assertEqual(util.sanitize(u'日*本?'), u'日本')
+
+
+    def testByteStrings(self):
+        self.assertEqual(util.sanitize('ab*c', wildcards=True), u'%')
+        self.assertEqual(util.sanitize('ab\xe6\x97\xa5c'), u'')
+        self.assertIsInstance(util.sanitize('abc'), unicode)
+
+
+if __name__ == '__main__':
+    unittest.main()
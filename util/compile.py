@@ -18,11 +18,18 @@
 
 
 import codecs
+import collections
+import hashlib
+import json
 import optparse
 import os
 import re
 import sqlite3
 import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../yomi_base/japanese'))
+import bloom
 
 
 PARSED_TAGS = {
@@ -129,6 +136,7 @@ def writeKanjiDic(cursor, values):
     cursor.execute('DROP TABLE IF EXISTS Kanji')
     cursor.execute('CREATE TABLE Kanji(character TEXT, kunyomi TEXT, onyomi TEXT, glossary TEXT)')
     cursor.executemany('INSERT INTO Kanji VALUES(?, ?, ?, ?)', values)
+    cursor.execute('CREATE INDEX index_Kanji_character ON Kanji(character)')
 
 
 def parseKradFile(path):
@@ -147,6 +155,7 @@ def writeKradFile(cursor, values):
     cursor.execute('DROP TABLE IF EXISTS Radicals')
     cursor.execute('CREATE TABLE Radicals(character TEXT, radicals TEXT)')
     cursor.executemany('INSERT INTO Radicals VALUES(?, ?)', values)
+    cursor.execute('CREATE INDEX index_Radicals_character ON Radicals(character)')
 
 
 def parseEdict(path):
@@ -176,13 +185,143 @@ def parseEdict(path):
     return results
 
 
+def termPriority(tags):
+    return 1 if 'P' in tags.split() else 0
+
+
 def writeEdict(cursor, values):
     cursor.execute('DROP TABLE IF EXISTS Terms')
-    cursor.execute('CREATE TABLE Terms(expression TEXT, reading TEXT, glossary TEXT, tags TEXT)')
-    cursor.executemany('INSERT INTO Terms VALUES(?, ?, ?, ?)', values)
+    cursor.execute('CREATE TABLE Terms(expression TEXT, reading TEXT, glossary TEXT, tags TEXT, inverse TEXT, priority INTEGER)')
+    cursor.executemany('INSERT INTO Terms VALUES(?, ?, ?, ?, ?, ?)', [value + (value[0][::-1], termPriority(value[3])) for value in values])
+    cursor.execute('CREATE INDEX index_Terms_expression ON Terms(expression, priority)')
+    cursor.execute('CREATE INDEX index_Terms_reading ON Terms(reading, priority)')
+    cursor.execute('CREATE INDEX index_Terms_inverse ON Terms(inverse)')
+
+
+def buildGlossaryDictionary(values, size=32768):
+    counts = collections.Counter()
+    for expression, reading, glossary, tags in values:
+        counts.update(glossary.split('; '))
+
+    phrases = list()
+    for phrase, count in counts.most_common():
+        if count < 2 or size <= 0:
+            break
+        phrases.append(phrase)
+        size -= len(phrase.encode('utf-8')) + 2
+
+    return '; '.join(reversed(phrases)).encode('utf-8')
+
+
+def compressGlossaries(values):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    prefix = compressor.compress(buildGlossaryDictionary(values)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    results = list()
+    for expression, reading, glossary, tags in values:
+        data = glossary.encode('utf-8')
+        copy = compressor.copy()
+        compressed = copy.compress(data) + copy.flush()
+        if len(compressed) < len(data):
+            glossary = sqlite3.Binary(compressed)
+        results.append((expression, reading, glossary, tags))
+
+    return prefix, results
+
+
+def measureTerms(values):
+    results = dict()
+    for expression, reading, glossary, tags in values:
+        for term in filter(None, [expression, reading]):
+            results[term[0]] = max(results.get(term[0], 0), len(term))
+
+    return results
+
+
+def writeMetadata(cursor, values):
+    cursor.execute('CREATE TABLE IF NOT EXISTS Metadata(name TEXT PRIMARY KEY, value)')
+    cursor.executemany('INSERT OR REPLACE INTO Metadata VALUES(?, ?)', values.items())
+
+
+def writeGrams(cursor):
+    grams = list()
+    for rowid, expression in cursor.execute('SELECT rowid, expression FROM Terms').fetchall():
+        for gram in set(expression[i:i + 2] for i in xrange(len(expression) - 1)):
+            grams.append((gram, rowid))
+
+    cursor.execute('DROP TABLE IF EXISTS Grams')
+    cursor.execute('CREATE TABLE Grams(gram TEXT, term INTEGER)')
+    cursor.executemany('INSERT INTO Grams VALUES(?, ?)', grams)
+    cursor.execute('CREATE INDEX index_Grams_gram ON Grams(gram, term)')
+
+
+def loadDeinflect(path):
+    print 'Parsing "{0}"...'.format(path)
+    with codecs.open(path, 'rb', 'utf-8') as fp:
+        return json.load(fp)
 
 
-def build(path, kanjidic, kradfile, edict, enamdict):
+def matchTags(patterns, tags, cache):
+    key = tuple(patterns), tuple(tags)
+    if key not in cache:
+        cache[key] = len(patterns) == 0 or any(re.search(p, t) for p in patterns for t in tags)
+
+    return cache[key]
+
+
+def parseInflections(rules, terms, depth):
+    variants = dict()
+    for rule, group in rules.items():
+        for variant in group:
+            variants.setdefault(variant['kanaOut'], list()).append((rule, variant))
+
+    results = set()
+    cache = dict()
+
+    for expression, reading, glossary, tags in terms:
+        tags = tags.split()
+        for root in set(filter(None, [expression, reading])):
+            level = [(root, tags, list())]
+            for i in xrange(depth):
+                forms = list()
+                for form, tagsIn, chain in level:
+                    for kanaOut, group in variants.items():
+                        if not form.endswith(kanaOut):
+                            continue
+
+                        for rule, variant in group:
+                            if not matchTags(variant['tagsOut'], tagsIn, cache):
+                                continue
+
+                            inflected = form[:len(form) - len(kanaOut)] + variant['kanaIn']
+                            forms.append((inflected, variant['tagsIn'], chain + [rule]))
+                            results.add((inflected, root, ';'.join(chain + [rule])))
+
+                level = [(form, tagsIn, chain) for form, tagsIn, chain in forms if tagsIn]
+
+    return results
+
+
+def writeInflections(cursor, values):
+    cursor.execute('DROP TABLE IF EXISTS Inflections')
+    cursor.execute('CREATE TABLE Inflections(form TEXT, root TEXT, rules TEXT)')
+    cursor.executemany('INSERT INTO Inflections VALUES(?, ?, ?)', values)
+    cursor.execute('CREATE INDEX index_Inflections_form ON Inflections(form)')
+
+
+def writeFilter(path, db):
+    cursor = db.cursor()
+    cursor.execute('SELECT expression FROM Terms UNION SELECT reading FROM Terms WHERE reading IS NOT NULL')
+    keys = sorted(row[0] for row in cursor.fetchall())
+    key = hashlib.sha1(u'\n'.join(keys).encode('utf-8')).hexdigest()
+    result = bloom.build(keys)
+
+    writeMetadata(db, {'filterKey': key})
+    with open(os.path.splitext(path)[0] + '.bloom', 'wb') as fp:
+        bloom.dump(fp, key, result)
+
+
+def build(path, kanjidic, kradfile, edict, enamdict, deinflect, inflections, compress):
     with sqlite3.connect(path) as db:
         if kanjidic is not None:
             writeKanjiDic(db, parseKanjiDic(kanjidic))
@@ -195,8 +334,26 @@ def build(path, kanjidic, kradfile, edict, enamdict):
             terms += parseEdict(edict)
         if enamdict is not None:
             terms += parseEdict(enamdict)
-        if len(terms) > 0:
+        if len(terms) > 0 and compress:
+            prefix, rows = compressGlossaries(terms)
+            writeMetadata(db, {'glossaryPrefix': sqlite3.Binary(prefix)})
+            writeEdict(db, rows)
+            writeGrams(db)
+        elif len(terms) > 0:
             writeEdict(db, terms)
+            writeGrams(db)
+
+        if len(terms) > 0:
+            writeMetadata(db, {'termLengths': json.dumps(measureTerms(terms))})
+
+        if len(terms) > 0 and inflections > 0:
+            writeInflections(db, parseInflections(loadDeinflect(deinflect), terms, inflections))
+            writeMetadata(db, {'inflectionDepth': inflections})
+
+        db.execute('ANALYZE')
+
+        if len(terms) > 0:
+            writeFilter(path, db)
 
 
 def main():
@@ -205,6 +362,9 @@ def main():
     parser.add_option('--kradfile', dest='kradfile')
     parser.add_option('--edict', dest='edict')
     parser.add_option('--enamdict', dest='enamdict')
+    parser.add_option('--deinflect', dest='deinflect', default=os.path.join(os.path.dirname(__file__), '../yomi_base/japanese/deinflect.json'))
+    parser.add_option('--inflections', dest='inflections', type='int', default=0)
+    parser.add_option('--compress', dest='compress', action='store_true', default=False)
 
     options, args = parser.parse_args()
 
@@ -216,7 +376,10 @@ def main():
             options.kanjidic,
             options.kradfile,
             options.edict,
-            options.enamdict
+            options.enamdict,
+            options.deinflect,
+            options.inflections,
+            options.compress
         )
 
 
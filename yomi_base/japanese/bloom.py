@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2013  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import marshal
+import math
+import struct
+
+
+FORMAT_VERSION = 1
+
+
+class BloomFilter:
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8) if bits is None else bytearray(bits)
+
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+
+    def __contains__(self, key):
+        for position in self.positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+
+    def positions(self, key):
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(key.encode('utf-8')).digest())
+        for i in xrange(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+
+def build(keys, errorRate=0.01):
+    keys = set(keys)
+    count = max(len(keys), 1)
+    size = int(math.ceil(-count * math.log(errorRate) / math.log(2) ** 2))
+    hashes = max(int(round(float(size) / count * math.log(2))), 1)
+
+    result = BloomFilter(size, hashes)
+    for key in keys:
+        result.add(key)
+
+    return result
+
+
+def dump(fp, key, bloom):
+    marshal.dump((FORMAT_VERSION, key, bloom.size, bloom.hashes, str(bloom.bits)), fp)
+
+
+def load(fp):
+    version, key, size, hashes, bits = marshal.load(fp)
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported filter version {0}'.format(version))
+
+    return key, BloomFilter(size, hashes, bits)
@@ -16,84 +16,106 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import codecs
+import hashlib
 import json
+import marshal
+import os
 import re
+import threading
+import util
+
+
+CACHE_VERSION = 1
 
 
 #
-# Deinflection
+# TagMatcher
 #
 
-class Deinflection:
-    def __init__(self, term, tags=list(), rule=str()):
-        self.children = list()
-        self.term = term
-        self.tags = tags
-        self.rule = rule
-        self.success = False
+class TagMatcher:
+    def __init__(self, patterns):
+        self.patterns = sorted(set(patterns))
+        self.bits = dict((p, 1 << i) for i, p in enumerate(self.patterns))
+        self.masks = dict()
 
 
-    def validate(self, validator):
-        for tags in validator(self.term):
-            if len(self.tags) == 0:
-                return True
+    def patternMask(self, patterns):
+        mask = 0
+        for pattern in patterns:
+            mask |= self.bits[pattern]
 
-            for tag in self.tags:
-                if self.searchTags(tag, tags):
-                    return True
+        return mask
 
 
-    def deinflect(self, validator, rules):
-        if self.validate(validator):
-            child = Deinflection(self.term)
-            self.children.append(child)
+    def tagMask(self, tags):
+        mask = 0
+        for tag in tags:
+            tagMask = self.masks.get(tag)
+            if tagMask is None:
+                tagMask = self.masks[tag] = self.searchPatterns(tag)
+            mask |= tagMask
 
-        for rule, variants in rules.items():
-            for variant in variants:
-                tagsIn = variant['tagsIn']
-                tagsOut = variant['tagsOut']
-                kanaIn = variant['kanaIn']
-                kanaOut = variant['kanaOut']
-
-                allowed = len(self.tags) == 0
-                for tag in self.tags:
-                    if self.searchTags(tag, tagsIn):
-                        allowed = True
-                        break
+        return mask
+
+
+    def searchPatterns(self, tag):
+        mask = 0
+        for pattern in self.patterns:
+            if re.search(pattern, tag):
+                mask |= self.bits[pattern]
+
+        return mask
 
-                if not allowed or not self.term.endswith(kanaIn):
-                    continue
 
-                term = self.term[:-len(kanaIn)] + kanaOut
+#
+# Deinflection
+#
 
-                child = Deinflection(term, tagsOut, rule)
-                if child.deinflect(validator, rules):
-                    self.children.append(child)
+class Deinflection(object):
+    __slots__ = ('term', 'mask', 'rule', 'parent')
 
-        if len(self.children) > 0:
-            return True
+    def __init__(self, term, mask=0, rule=str(), parent=None):
+        self.term = term
+        self.mask = mask
+        self.rule = rule
+        self.parent = parent
 
 
-    def searchTags(self, tag, tags):
-        for t in tags:
-            if re.search(tag, t):
+    def validate(self, entries, matcher):
+        for tags in entries:
+            if self.mask == 0 or self.mask & matcher.tagMask(tags):
                 return True
 
 
+    def deinflect(self, trie):
+        for rule, kanaIn, kanaOut, maskIn, maskOut in self.matchRules(trie):
+            if self.mask != 0 and self.mask & maskIn == 0:
+                continue
+
+            term = self.term[:-len(kanaIn)] + kanaOut
+            yield Deinflection(term, maskOut, rule, self)
+
+
+    def matchRules(self, trie):
+        node = trie
+        for c in reversed(self.term):
+            node = node['children'].get(c)
+            if node is None:
+                break
+
+            for variant in node['variants']:
+                yield variant
+
+
     def gather(self):
-        if len(self.children) == 0:
-            return [{'root': self.term, 'rules': list()}]
+        rules = list()
 
-        paths = list()
-        for child in self.children:
-            for path in child.gather():
-                if self.rule:
-                    path['rules'].append(self.rule)
-                path['source'] = self.term
-                paths.append(path)
+        node = self
+        while node.parent is not None:
+            rules.append(node.rule)
+            node = node.parent
 
-        return paths
+        return self.term, node.term, tuple(rules)
 
 
 #
@@ -101,12 +123,176 @@ class Deinflection:
 #
 
 class Deinflector:
-    def __init__(self, filename):
-        with codecs.open(filename, 'rb', 'utf-8') as fp:
-            self.rules = json.load(fp)
+    def __init__(self, filename, cacheSize=1024, maxDepth=10, maxNodes=1000):
+        compiled = self.loadRules(filename)
+        self.rules = compiled['rules']
+        self.matcher = TagMatcher(compiled['patterns'])
+        self.trie = compiled['trie']
+        self.cache = util.LruCache(cacheSize)
+        self.maxDepth = maxDepth
+        self.maxNodes = maxNodes
+        self.lock = threading.Lock()
+        self.truncations = 0
+        self.kanaLength, self.growth = self.measureGrowth()
+
+
+    def loadRules(self, filename):
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+
+        key = CACHE_VERSION, os.path.getmtime(filename), hashlib.sha1(data).hexdigest()
+        cachename = os.path.splitext(filename)[0] + '.cache'
+
+        try:
+            with open(cachename, 'rb') as fp:
+                compiled = marshal.load(fp)
+            if compiled['key'] == key:
+                return compiled
+        except (IOError, EOFError, ValueError, TypeError, KeyError):
+            pass
+
+        rules = json.loads(data.decode('utf-8'))
+        matcher = self.buildMatcher(rules)
+        compiled = {
+            'key': key,
+            'rules': rules,
+            'patterns': matcher.patterns,
+            'trie': self.buildTrie(rules, matcher)
+        }
+
+        try:
+            with open(cachename, 'wb') as fp:
+                marshal.dump(compiled, fp)
+        except (IOError, OSError):
+            pass
+
+        return compiled
+
+
+    def buildMatcher(self, rules):
+        patterns = list()
+        for variants in rules.values():
+            for variant in variants:
+                patterns.extend(variant['tagsOut'])
+
+        return TagMatcher(patterns)
+
+
+    def buildTrie(self, rules, matcher):
+        trie = {'children': dict(), 'variants': list()}
+
+        for rule, variants in rules.items():
+            for variant in variants:
+                node = trie
+                for c in reversed(variant['kanaIn']):
+                    node = node['children'].setdefault(c, {'children': dict(), 'variants': list()})
+
+                node['variants'].append((
+                    rule,
+                    variant['kanaIn'],
+                    variant['kanaOut'],
+                    matcher.tagMask(variant['tagsIn']),
+                    matcher.patternMask(variant['tagsOut'])
+                ))
+
+        return trie
+
+
+    def measureGrowth(self):
+        variants = list()
+        for group in self.rules.values():
+            for variant in group:
+                variants.append((
+                    len(variant['kanaIn']) - len(variant['kanaOut']),
+                    self.matcher.tagMask(variant['tagsIn']),
+                    self.matcher.patternMask(variant['tagsOut'])
+                ))
+
+        growth = 0
+        bits = dict()
+        for depth in xrange(self.maxDepth):
+            growth = 0
+            chains = dict()
+            for shrink, maskIn, maskOut in variants:
+                tail = 0
+                mask = maskOut
+                while mask:
+                    bit = mask & -mask
+                    tail = max(tail, bits.get(bit, 0))
+                    mask ^= bit
+
+                chain = shrink + tail
+                growth = max(growth, chain)
+
+                mask = maskIn
+                while mask:
+                    bit = mask & -mask
+                    chains[bit] = max(chains.get(bit, 0), chain)
+                    mask ^= bit
+
+            bits = chains
+
+        kanaLength = 0
+        for group in self.rules.values():
+            for variant in group:
+                kanaLength = max(kanaLength, len(variant['kanaIn']))
+
+        return kanaLength, growth
+
+
+    def canDeinflect(self, term):
+        return next(Deinflection(term).matchRules(self.trie), None) is not None
 
 
     def deinflect(self, term, validator):
-        node = Deinflection(term)
-        if node.deinflect(validator, self.rules):
-            return node.gather()
+        key = term, validator
+        result = self.cache.get(key)
+        if result is None:
+            result = self.search(term, validator)
+            self.cache.put(key, result)
+            if result[1]:
+                with self.lock:
+                    self.truncations += 1
+
+        paths, truncated = result
+        return paths
+
+
+    def search(self, term, validator):
+        root = Deinflection(term)
+        visited = set([(root.term, root.mask)])
+        level = [root]
+        valid = list()
+        truncated = False
+
+        depth = 0
+        while level:
+            entries = validator(set(node.term for node in level))
+            children = list()
+            for node in level:
+                if node.validate(entries.get(node.term, list()), self.matcher):
+                    valid.append(node)
+
+                if depth >= self.maxDepth:
+                    truncated = truncated or next(node.deinflect(self.trie), None) is not None
+                    continue
+
+                for child in node.deinflect(self.trie):
+                    state = child.term, child.mask
+                    if state in visited:
+                        continue
+
+                    if len(visited) >= self.maxNodes:
+                        truncated = True
+                        break
+
+                    visited.add(state)
+                    children.append(child)
+
+            level = children
+            depth += 1
+
+        if len(valid) > 0:
+            return tuple(node.gather() for node in valid), truncated
+
+        return None, truncated
@@ -16,73 +16,448 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import bloom
+import json
 import operator
+import os.path
+import re
 import sqlite3
+import threading
+import zlib
+
+
+class Record(object):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+    def keys(self):
+        return self.fields
+
+
+class Term(Record):
+    __slots__ = ('rowid', 'expression', 'reading', 'glossaryData', 'glossaryText', 'codec', 'tagString', 'tagList', 'priority', 'rules', 'source', 'sentence')
+    fields = ('expression', 'reading', 'glossary', 'tags', 'rules', 'source', 'sentence')
+
+    def __init__(self, rowid, expression, reading, glossary, tagString, priority=0, rules=None, source=None, codec=None):
+        self.rowid = rowid
+        self.expression = expression
+        self.reading = reading
+        self.setGlossary(glossary, codec)
+        self.tagString = tagString
+        self.tagList = None
+        self.priority = priority
+        self.rules = rules
+        self.source = source
+        self.sentence = None
+
+
+    def setGlossary(self, glossary, codec=None):
+        self.glossaryData = glossary
+        self.glossaryText = None if codec else glossary
+        self.codec = codec
+
+
+    @property
+    def glossary(self):
+        if self.glossaryText is None:
+            self.glossaryText = self.codec.decompress(self.glossaryData)
+
+        return self.glossaryText
+
+
+    @property
+    def tags(self):
+        if self.tagList is None:
+            self.tagList = self.tagString.split()
+
+        return self.tagList
+
+
+    def deinflected(self, source, rules):
+        term = Term(self.rowid, self.expression, self.reading, self.glossaryData, self.tagString, self.priority, rules, source, self.codec)
+        term.glossaryText = self.glossaryText
+        return term
+
+
+class GlossaryCodec:
+    def __init__(self, prefix):
+        self.decompressor = zlib.decompressobj(-15)
+        self.decompressor.decompress(str(prefix))
+
+
+    def decompress(self, data):
+        decompressor = self.decompressor.copy()
+        return (decompressor.decompress(data) + decompressor.flush()).decode('utf-8')
+
+
+class Kanji(Record):
+    __slots__ = ('character', 'kunyomi', 'onyomi', 'glossary')
+    fields = __slots__
+
+    def __init__(self, character, kunyomi, onyomi, glossary):
+        self.character = character
+        self.kunyomi = kunyomi
+        self.onyomi = onyomi
+        self.glossary = glossary
 
 
 class Dictionary:
-    def __init__(self, filename, index=True):
-        self.db = sqlite3.connect(filename)
+    def __init__(self, filename, index=True, cachedStatements=256):
+        self.filename = filename
+        self.cachedStatements = cachedStatements
+        self.local = threading.local()
+        self.lock = threading.Lock()
         self.indices = set()
+        self.tables = set()
+        self.columns = set()
+        self.kanji = None
+        self.radicals = None
+        self.metadata = dict()
+        self.codec = None
+        self.termLengths = None
+        self.inflectionDepth = 0
+        self.batchSize = 400
 
+        db = sqlite3.connect(filename)
+        cursor = db.cursor()
+        cursor.execute('SELECT type, name FROM sqlite_master')
+        for kind, name in cursor.fetchall():
+            if kind == 'table':
+                self.tables.add(name)
+            elif kind == 'index':
+                self.indices.add(name)
 
-    def findTerm(self, word, wildcards=False):
-        self.requireIndex('Terms', 'expression')
-        self.requireIndex('Terms', 'reading')
+        if self.hasTable('Terms'):
+            cursor.execute('PRAGMA table_info(Terms)')
+            self.columns.update('Terms.' + column[1] for column in cursor.fetchall())
+
+        if self.hasTable('Metadata'):
+            cursor.execute('SELECT name, value FROM Metadata')
+            self.metadata.update(cursor.fetchall())
+
+        if 'glossaryPrefix' in self.metadata:
+            self.codec = GlossaryCodec(self.metadata['glossaryPrefix'])
+
+        if 'termLengths' in self.metadata:
+            self.termLengths = json.loads(self.metadata['termLengths'])
+
+        if 'inflectionDepth' in self.metadata:
+            self.inflectionDepth = int(self.metadata['inflectionDepth'])
+
+        if index:
+            self.requireIndex(db, 'Terms', 'expression')
+            self.requireIndex(db, 'Terms', 'reading')
+            self.requireIndex(db, 'Kanji', 'character')
+
+        db.close()
+
+        self.filter = self.loadFilter(os.path.splitext(filename)[0] + '.bloom')
+
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = self.connect()
+
+        return db
+
+
+    def connect(self):
+        db = sqlite3.connect(self.filename, cached_statements=self.cachedStatements)
+        for pragma in ['query_only = ON', 'temp_store = MEMORY', 'cache_size = -16384', 'mmap_size = 268435456']:
+            db.execute('PRAGMA {0}'.format(pragma))
+
+        return db
+
+
+    def findTerm(self, word, wildcards=False, glossaries=True):
+        if wildcards and re.search('[%_]', word):
+            return self.findPattern(word, glossaries)
+
+        if self.filter is not None and word not in self.filter:
+            return list()
 
         cursor = self.db.cursor()
-        cursor.execute('SELECT * FROM Terms WHERE expression {0} ? OR reading=? LIMIT 100'.format('LIKE' if wildcards else '='), (word, word))
+        cursor.execute(self.termQuery(glossaries), (word, word))
+
+        results = list()
+        for rowid, expression, reading, glossary, tags, priority in cursor.fetchall():
+            results.append(self.createTerm(rowid, expression, reading, glossary, tags, priority))
+
+        return results
+
+
+    def findPattern(self, pattern, glossaries=True):
+        pattern = pattern.replace('%', '*').replace('_', '?')
+        prefix = re.match(u'[^*?]*', pattern).group(0)
+        suffix = re.search(u'[^*?]*$', pattern).group(0)
+        segments = re.findall(u'[^*?]+', pattern)
+        if len(segments) == 0:
+            return list()
+
+        grams = set()
+        for segment in segments:
+            grams.update(segment[i:i + 2] for i in xrange(len(segment) - 1))
+        indexed = self.hasTable('Grams') and self.hasColumn('Terms', 'inverse')
+        order = 'ORDER BY priority DESC'
+
+        if prefix:
+            condition = 'expression >= ? AND expression < ? AND expression GLOB ?'
+            params = [prefix, self.successor(prefix), pattern]
+        elif suffix and indexed:
+            condition = 'inverse >= ? AND inverse < ? AND inverse GLOB ?'
+            params = [suffix[::-1], self.successor(suffix[::-1]), pattern[::-1]]
+        elif grams and indexed:
+            subquery = ' INTERSECT '.join(['SELECT term FROM Grams WHERE gram=?'] * len(grams))
+            condition, params = 'rowid IN ({0}) AND expression GLOB ?'.format(subquery), list(grams) + [pattern]
+        elif segments and indexed:
+            c = segments[0]
+            subquery = 'SELECT term FROM Grams WHERE gram >= ? AND gram < ? UNION SELECT rowid FROM Terms WHERE inverse >= ? AND inverse < ?'
+            condition, params = 'rowid IN ({0}) AND expression GLOB ?'.format(subquery), [c, self.successor(c)] * 2 + [pattern]
+        else:
+            condition, params, order = 'expression GLOB ?', [pattern], str()
+
+        cursor = self.db.cursor()
+        cursor.execute('SELECT {0} FROM Terms WHERE {1} {2} LIMIT 100'.format(self.termColumns(glossaries), condition, order), params)
+
+        results = list()
+        for rowid, expression, reading, glossary, tags, priority in cursor.fetchall():
+            results.append(self.createTerm(rowid, expression, reading, glossary, tags, priority))
+
+        return results
+
 
+    def successor(self, prefix):
+        return prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+
+
+    def findTerms(self, words, glossaries=True):
+        words = list(words)
+        if self.filter is not None:
+            words = [word for word in words if word in self.filter]
         results = list()
-        for expression, reading, glossary, tags in cursor.fetchall():
-            results.append({
-                'expression': expression,
-                'reading': reading,
-                'glossary': glossary,
-                'tags': tags.split()
-            })
+        rowids = set()
+        cursor = self.db.cursor()
+
+        for i in xrange(0, len(words), self.batchSize):
+            batch = words[i:i + self.batchSize]
+            cursor.execute(self.termsQuery(glossaries, len(batch)), batch + batch)
+
+            for rowid, expression, reading, glossary, tags, priority in cursor.fetchall():
+                if rowid in rowids:
+                    continue
+
+                rowids.add(rowid)
+                results.append(self.createTerm(rowid, expression, reading, glossary, tags, priority))
+
+        return results
+
+
+    def findPrefixes(self, text, glossaries=True):
+        return self.findWords([text[:i] for i in xrange(1, len(text) + 1)], glossaries)
+
+
+    def findWords(self, words, glossaries=True):
+        results = dict((word, list()) for word in words)
+        for entry in self.findTerms(results.keys(), glossaries):
+            for word in set([entry.expression, entry.reading]):
+                if word in results:
+                    results[word].append(entry)
 
         return results
 
 
+    def maxTermLength(self, c):
+        if self.termLengths is None:
+            return None
+
+        return self.termLengths.get(c, 0)
+
+
+    def findInflections(self, forms):
+        if not self.hasTable('Inflections'):
+            return None
+
+        forms = list(forms)
+        results = dict((form, list()) for form in forms)
+        cursor = self.db.cursor()
+
+        for i in xrange(0, len(forms), self.batchSize):
+            batch = forms[i:i + self.batchSize]
+            cursor.execute('SELECT form, root, rules FROM Inflections WHERE form IN ({0})'.format(', '.join('?' * len(batch))), batch)
+            for form, root, rules in cursor.fetchall():
+                results[form].append((root, tuple(rules.split(';'))))
+
+        return results
+
+
+    def loadGlossaries(self, terms):
+        pending = dict()
+        for term in terms:
+            if term.glossaryData is None:
+                pending.setdefault(term.rowid, list()).append(term)
+
+        rowids = pending.keys()
+        cursor = self.db.cursor()
+
+        for i in xrange(0, len(rowids), self.batchSize):
+            batch = rowids[i:i + self.batchSize]
+            cursor.execute('SELECT rowid, glossary FROM Terms WHERE rowid IN ({0})'.format(', '.join('?' * len(batch))), batch)
+            for rowid, glossary in cursor.fetchall():
+                for term in pending[rowid]:
+                    self.setGlossary(term, glossary)
+
+
+    def termQuery(self, glossaries):
+        return 'SELECT {0} FROM Terms WHERE expression=? UNION SELECT {0} FROM Terms WHERE reading=? ORDER BY priority DESC LIMIT 100'.format(
+            self.termColumns(glossaries)
+        )
+
+
+    def termsQuery(self, glossaries, count):
+        return 'SELECT {0} FROM Terms WHERE expression IN ({1}) UNION SELECT {0} FROM Terms WHERE reading IN ({1}) ORDER BY priority DESC'.format(
+            self.termColumns(glossaries),
+            ', '.join('?' * count)
+        )
+
+
+    def termColumns(self, glossaries):
+        return 'rowid, expression, reading, {0} AS glossary, tags, {1} AS priority'.format(
+            'glossary' if glossaries else 'NULL',
+            'priority' if self.hasColumn('Terms', 'priority') else "' ' || tags || ' ' GLOB '* P *'"
+        )
+
+
+    def createTerm(self, rowid, expression, reading, glossary, tags, priority):
+        term = Term(rowid, expression, reading, None, tags, priority)
+        self.setGlossary(term, glossary)
+        return term
+
+
+    def setGlossary(self, term, glossary):
+        if isinstance(glossary, buffer):
+            term.setGlossary(str(glossary), self.codec)
+        else:
+            term.setGlossary(glossary)
+
+
     def findCharacter(self, character):
         assert len(character) == 1
-        self.requireIndex('Kanji', 'character')
+        return self.loadKanji().get(character)
 
-        cursor = self.db.cursor()
-        cursor.execute('SELECT * FROM Kanji WHERE character=? LIMIT 1', character)
 
-        query = cursor.fetchone()
-        if query is not None:
-            character, kunyomi, onyomi, glossary = query
-            return {
-                'character': character,
-                'kunyomi': kunyomi,
-                'onyomi': onyomi,
-                'glossary': glossary
-            }
+    def findCharacters(self, characters):
+        kanji = self.loadKanji()
+        return [kanji[c] for c in characters if c in kanji]
+
 
+    def loadKanji(self):
+        with self.lock:
+            if self.kanji is None:
+                kanji = dict()
+                if self.hasTable('Kanji'):
+                    cursor = self.db.cursor()
+                    cursor.execute('SELECT character, kunyomi, onyomi, glossary FROM Kanji')
+                    for row in cursor.fetchall():
+                        kanji.setdefault(row[0], Kanji(*row))
 
-    def requireIndex(self, table, column):
+                self.kanji = kanji
+
+        return self.kanji
+
+
+    def findCharactersByRadicals(self, radicals):
+        characters, index = self.loadRadicals()
+        if len(radicals) == 0:
+            return list()
+
+        mask = -1
+        for radical in radicals:
+            mask &= index.get(radical, 0)
+
+        results = list()
+        while mask:
+            bit = mask & -mask
+            results.append(characters[bit.bit_length() - 1])
+            mask ^= bit
+
+        return results
+
+
+    def loadRadicals(self):
+        with self.lock:
+            if self.radicals is None:
+                characters = list()
+                index = dict()
+                if self.hasTable('Radicals'):
+                    cursor = self.db.cursor()
+                    cursor.execute('SELECT character, radicals FROM Radicals')
+                    for character, radicals in cursor.fetchall():
+                        bit = 1 << len(characters)
+                        characters.append(character)
+                        for radical in radicals.split():
+                            index[radical] = index.get(radical, 0) | bit
+
+                self.radicals = characters, index
+
+        return self.radicals
+
+
+    def loadFilter(self, filename):
+        if not self.hasTable('Terms') or 'filterKey' not in self.metadata:
+            return None
+
+        try:
+            with open(filename, 'rb') as fp:
+                key, result = bloom.load(fp)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+        if key != self.metadata['filterKey']:
+            return None
+
+        return result
+
+
+    def requireIndex(self, db, table, column):
         name = 'index_{0}_{1}'.format(table, column)
-        if not self.hasIndex(name):
-            self.buildIndex(name, table, column)
+        if self.hasTable(table) and not self.hasIndex(name):
+            self.buildIndex(db, name, table, column)
 
 
-    def buildIndex(self, name, table, column):
-        cursor = self.db.cursor()
+    def buildIndex(self, db, name, table, column):
+        cursor = db.cursor()
         cursor.execute('CREATE INDEX {0} ON {1}({2})'.format(name, table, column))
-        self.db.commit()
+        db.commit()
+        self.indices.add(name)
 
 
     def hasIndex(self, name):
-        if name in self.indices:
-            return True
+        return name in self.indices
+
+
+    def hasTable(self, name):
+        return name in self.tables
 
-        cursor = self.db.cursor()
-        cursor.execute('SELECT * FROM sqlite_master WHERE name=?', (name,))
-        if len(cursor.fetchall()) == 0:
-            return False
 
-        self.indices.update([name])
-        return True
+    def hasColumn(self, table, column):
+        return '{0}.{1}'.format(table, column) in self.columns
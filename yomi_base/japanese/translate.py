@@ -17,75 +17,239 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import operator
+import heapq
+import threading
 import util
 
 
 class Translator:
-    def __init__(self, deinflector, dictionary):
+    def __init__(self, deinflector, dictionary, cacheSize=256, rowCacheSize=1024):
         self.deinflector = deinflector
         self.dictionary = dictionary
+        self.cache = util.LruCache(cacheSize)
+        self.rows = util.LruCache(rowCacheSize)
+        self.local = threading.local()
 
 
-    def findTerm(self, text, wildcards=False):
+    def setDictionary(self, dictionary):
+        self.dictionary = dictionary
+        self.clearCache()
+
+
+    def clearCache(self):
+        self.cache.clear()
+        self.rows.clear()
+        self.deinflector.cache.clear()
+
+
+    def findTerm(self, text, wildcards=False, limit=None):
         text = util.sanitize(text, wildcards=wildcards)
+        key = text, wildcards, limit
+        result = self.cache.get(key)
+        if result is None:
+            result = self.lookupTerm(text, wildcards, limit)
+            self.cache.put(key, result)
+
+        results, length = result
+        return [self.copyResult(r) for r in results], length
+
+
+    def lookupTerm(self, text, wildcards, limit):
+        terms = [text[:i] for i in xrange(len(text), 0, -1)]
+        self.local.scratch = dict()
+        try:
+            if wildcards:
+                terms = [term for term in terms if term.strip(u'%_')]
+                candidates = dict((term, self.findCandidates(term, wildcards=True)) for term in terms)
+            else:
+                candidates = self.findPrefixCandidates(terms)
+        finally:
+            self.local.scratch = None
+            self.local.inflections = None
 
         groups = dict()
-        for i in xrange(len(text), 0, -1):
-            term = text[:i]
-            deinflections = self.deinflector.deinflect(term, self.validator)
-            if deinflections is None:
-                self.processTerm(groups, term, wildcards=wildcards)
-            else:
-                for deinflection in deinflections:
-                    self.processTerm(groups, **deinflection)
+        for term in terms:
+            for entry, source, rules in candidates[term]:
+                if entry.rowid not in groups:
+                    groups[entry.rowid] = entry, source, rules
 
-        results = map(self.formatResult, groups.items())
-        results = filter(operator.truth, results)
-        results = sorted(results, key=lambda d: (len(d['source']), 'P' in d['tags'], -len(d['rules'])), reverse=True)
+        results = map(self.formatResult, groups.values())
 
         length = 0
         for result in results:
-            length = max(length, len(result['source']))
-
-        return results, length
+            length = max(length, len(result.source))
+
+        key = lambda d: (len(d.source), d.priority, -len(d.rules))
+        if limit is None or limit >= len(results):
+            ordered = sorted(results, key=key, reverse=True)
+            ranked = ordered
+        else:
+            ordered = None
+            ranked = heapq.nlargest(limit, results, key=key)
+
+        unique = list()
+        keys = set()
+        start = 0
+        while True:
+            batch = ranked[start:]
+            self.dictionary.loadGlossaries(batch)
+            for result in batch:
+                glossaryKey = result.expression, result.reading, result.glossaryData
+                if glossaryKey not in keys:
+                    keys.add(glossaryKey)
+                    unique.append(result)
+
+            start = len(ranked)
+            if limit is None or len(unique) >= limit or start >= len(results):
+                break
+
+            if ordered is None:
+                ordered = sorted(results, key=key, reverse=True)
+            ranked = ordered[:start + limit - len(unique)]
+
+        return unique, length
 
 
     def findCharacters(self, text):
         text = util.sanitize(text, kana=False)
-        results = list()
 
-        processed = dict()
+        characters = list()
+        seen = set()
         for c in text:
-            if c not in processed:
-                match = self.dictionary.findCharacter(c)
-                if match is not None:
-                    results.append(match)
-                processed[c] = match
+            if c not in seen:
+                seen.add(c)
+                characters.append(c)
+
+        return self.dictionary.findCharacters(characters)
+
+
+    def findCharactersByRadicals(self, text):
+        radicals = set(c for c in text if not c.isspace())
+        return self.dictionary.findCharacters(self.dictionary.findCharactersByRadicals(radicals))
+
+
+    def findPrefixCandidates(self, terms):
+        entries = self.findWords(terms)
+        self.local.inflections = self.dictionary.findInflections(filter(self.deinflector.canDeinflect, terms))
+
+        results = dict()
+        for term in terms:
+            results[term] = self.findCandidates(term, entries[term])
+
+        return results
+
+
+    def findCandidates(self, term, entries=None, wildcards=False):
+        candidates = list()
+        if entries is not None and not (self.deinflector.canDeinflect(term) and self.canReach(term)):
+            self.processEntries(candidates, entries, term)
+            return candidates
+
+        deinflections = self.deinflect(term)
+        if deinflections is None:
+            self.processTerm(candidates, term, wildcards=wildcards)
+        else:
+            for root, source, rules in deinflections:
+                self.processTerm(candidates, source, rules, root)
+
+        return candidates
+
+
+    def findWords(self, words):
+        scratch = getattr(self.local, 'scratch', None)
+        if scratch is None:
+            scratch = dict()
+
+        results = dict()
+        missing = list()
+        for word in words:
+            entries = scratch.get(word)
+            if entries is None:
+                entries = self.rows.get(word)
+            if entries is None and not self.canMatch(word):
+                entries = list()
+
+            if entries is None:
+                missing.append(word)
+            else:
+                results[word] = scratch[word] = entries
+
+        if len(missing) > 0:
+            for word, entries in self.dictionary.findWords(missing, glossaries=False).items():
+                results[word] = scratch[word] = entries
+                self.rows.put(word, entries)
 
         return results
 
 
-    def processTerm(self, groups, source, rules=list(), root=str(), wildcards=False):
+    def canMatch(self, term):
+        length = self.dictionary.maxTermLength(term[:1])
+        return length is None or len(term) <= length
+
+
+    def canReach(self, term):
+        length = self.dictionary.maxTermLength(term[:1])
+        return length is None or len(term) <= max(length, self.deinflector.kanaLength) + self.deinflector.growth
+
+
+    def deinflect(self, term):
+        inflections = self.findInflections(term)
+        if inflections is None:
+            return self.deinflector.deinflect(term, self.validator)
+
+        if self.dictionary.inflectionDepth >= self.deinflector.maxDepth:
+            if len(inflections) == 0:
+                return None
+            deinflections = [(term, term, tuple())]
+        else:
+            deinflections = list(self.deinflector.deinflect(term, self.validator) or list())
+
+        known = set(deinflections)
+        for root, rules in inflections:
+            deinflection = root, term, rules
+            if deinflection not in known:
+                known.add(deinflection)
+                deinflections.append(deinflection)
+
+        return deinflections or None
+
+
+    def findInflections(self, term):
+        inflections = getattr(self.local, 'inflections', None)
+        if inflections is not None and term in inflections:
+            return inflections[term]
+
+        inflections = self.dictionary.findInflections([term])
+        return None if inflections is None else inflections[term]
+
+
+    def processTerm(self, candidates, source, rules=tuple(), root=str(), wildcards=False):
         root = root or source
+        if wildcards:
+            entries = self.dictionary.findTerm(root, wildcards, glossaries=False)
+        else:
+            entries = self.findWords([root])[root]
 
-        for entry in self.dictionary.findTerm(root, wildcards):
-            key = entry['expression'], entry['reading'], entry['glossary']
-            if key not in groups:
-                groups[key] = entry['tags'], source, rules
+        self.processEntries(candidates, entries, source, rules)
+
+
+    def processEntries(self, candidates, entries, source, rules=tuple()):
+        for entry in entries:
+            candidates.append((entry, source, rules))
 
 
     def formatResult(self, group):
-        (expression, reading, glossary), (tags, source, rules) = group
-        return {
-            'expression': expression,
-            'reading': reading,
-            'glossary': glossary,
-            'rules': rules,
-            'source': source,
-            'tags': tags
-        }
-
-
-    def validator(self, term):
-        return [d['tags'] for d in self.dictionary.findTerm(term)]
+        entry, source, rules = group
+        return entry.deinflected(source, rules)
+
+
+    def copyResult(self, result):
+        return result.deinflected(result.source, result.rules)
+
+
+    def validator(self, terms):
+        results = dict()
+        for term, entries in self.findWords(terms).items():
+            results[term] = [entry.tags for entry in entries]
+
+        return results
@@ -17,45 +17,116 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import collections
 import re
+import threading
+
+
+HIRAGANA_RANGES = [(0x3040, 0x30a0)]
+KATAKANA_RANGES = [(0x30a0, 0x3100)]
+KANA_RANGES = HIRAGANA_RANGES + KATAKANA_RANGES
+KANJI_RANGES = [(0x4e00, 0x9fb0), (0x3400, 0x4dc0)]
+JAPANESE_RANGES = KANA_RANGES + KANJI_RANGES
+
+WILDCARD_TABLE = {ord(u'*'): u'%', ord(u'＊'): u'%', ord(u'?'): u'_', ord(u'？'): u'_'}
+
+
+def inRanges(c, ranges):
+    value = ord(c)
+    for lower, upper in ranges:
+        if lower <= value < upper:
+            return True
+
+    return False
+
+
+def characterRanges(ranges):
+    return u''.join(u'{0}-{1}'.format(unichr(lower), unichr(upper - 1)) for lower, upper in ranges)
+
+
+def excludePattern(ranges, extra=unicode()):
+    return re.compile(u'[^{0}{1}]+'.format(characterRanges(ranges), extra))
+
+
+EXCLUDE_JAPANESE = excludePattern(JAPANESE_RANGES)
+EXCLUDE_KANJI = excludePattern(KANJI_RANGES)
+EXCLUDE_JAPANESE_WILDCARDS = excludePattern(JAPANESE_RANGES, u'%_')
+EXCLUDE_KANJI_WILDCARDS = excludePattern(KANJI_RANGES, u'%_')
 
 
 def isHiragana(c):
-    return 0x3040 <= ord(c) < 0x30a0
+    return inRanges(c, HIRAGANA_RANGES)
 
 
 def isKatakana(c):
-    return 0x30a0 <= ord(c) < 0x3100
+    return inRanges(c, KATAKANA_RANGES)
 
 
 def isKana(c):
-    return isHiragana(c) or isKatakana(c)
+    return inRanges(c, KANA_RANGES)
 
 
 def isKanji(c):
-    return 0x4e00 <= ord(c) < 0x9fb0 or 0x3400 <= ord(c) < 0x4dc0
+    return inRanges(c, KANJI_RANGES)
 
 
 def isJapanese(c):
-    return isKana(c) or isKanji(c)
+    return inRanges(c, JAPANESE_RANGES)
 
 
 def sanitize(text, kana=True, wildcards=False):
-    if kana:
-        checker = isJapanese
-    else:
-        checker = isKanji
+    if isinstance(text, str):
+        text = text.decode('latin-1')
 
     if wildcards:
-        text = re.sub(u'[\*＊]', u'%', text)
-        text = re.sub(u'[\?？]', u'_', text)
-        overrides = [u'%', u'_']
+        text = text.translate(WILDCARD_TABLE)
+        pattern = EXCLUDE_JAPANESE_WILDCARDS if kana else EXCLUDE_KANJI_WILDCARDS
     else:
-        overrides = list()
+        pattern = EXCLUDE_JAPANESE if kana else EXCLUDE_KANJI
+
+    return pattern.sub(unicode(), text)
+
+
+class LruCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
 
-    result = unicode()
-    for c in text:
-        if checker(c) or c in overrides:
-            result += c
 
-    return result
+    def hitRate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total > 0 else 0.0
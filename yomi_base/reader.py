@@ -285,7 +285,7 @@ class MainWindowReader(QtGui.QMainWindow, gen.reader_ui.Ui_MainWindowReader):
 
     def onVocabDefSearchReturn(self):
         text = unicode(self.textVocabSearch.text())
-        self.state.vocabDefs, length = self.language.findTerm(text, True)
+        self.state.vocabDefs, length = self.language.findTerm(text, True, self.preferences['maxResults'])
         self.updateVocabDefs()
         if self.dockKanji.isVisible():
             self.state.kanjiDefs = self.language.findCharacters(text)
@@ -494,7 +494,7 @@ class MainWindowReader(QtGui.QMainWindow, gen.reader_ui.Ui_MainWindowReader):
 
         lengthMatched = 0
         if self.dockVocab.isVisible():
-            self.state.vocabDefs, lengthMatched = self.language.findTerm(contentSampleFlat)
+            self.state.vocabDefs, lengthMatched = self.language.findTerm(contentSampleFlat, limit=self.preferences['maxResults'])
             sentence = reader_util.findSentence(content, samplePosStart)
             for definition in self.state.vocabDefs:
                 definition['sentence'] = sentence